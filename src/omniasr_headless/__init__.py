@@ -4,7 +4,19 @@ Omnilingual ASR Headless Adapter
 A clean, type-safe Python interface for Meta's Omnilingual ASR supporting 1600+ languages
 """
 
-from omniasr_headless.adapter import OmniASRAdapter
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from omniasr_headless.adapter import OmniASRAdapter
 
 __version__ = "0.1.0"
 __all__ = ["OmniASRAdapter"]
+
+
+def __getattr__(name: str) -> Any:
+    # Defer importing the adapter (and its audio dependencies) until it is first used
+    if name == "OmniASRAdapter":
+        from omniasr_headless.adapter import OmniASRAdapter
+
+        return OmniASRAdapter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,32 +1,215 @@
-from typing import List, Dict, Union, Optional, Literal, cast, Sequence
+from typing import TYPE_CHECKING, Any, Callable, Final, Iterator, List, Dict, Mapping, Tuple, Union, Optional, Literal, cast, Sequence
 from pathlib import Path
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import math
+import os
+import queue
+import threading
+import warnings
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import soundfile as sf
-import torch
-import torchaudio.transforms as T
-from omnilingual_asr.models.inference.pipeline import ASRInferencePipeline
+
+# torch, torchaudio and omnilingual_asr take seconds to import, so they are only
+# imported once a model is actually used.
+if TYPE_CHECKING:
+    import torch
 
 
 ModelSize = Literal["300M", "1B", "3B", "7B"]
+Precision = Literal["fp32", "bf16", "fp16", "auto"]
+# (input index, chunk index within that input, waveform, valid_length)
+_ChunkEntry = Tuple[int, int, np.ndarray, int]
 TARGET_SR = 16000
 CHUNK_DURATION_SEC = 30
 CHUNK_SAMPLES = CHUNK_DURATION_SEC * TARGET_SR
+# Neighbouring chunks share this much audio, so a word at a seam shorter than the
+# overlap is heard whole by one of them; longer words may still be cut in both
+OVERLAP_DURATION_SEC = 0.25
+OVERLAP_SAMPLES = int(OVERLAP_DURATION_SEC * TARGET_SR)
+HOP_SAMPLES = CHUNK_SAMPLES - OVERLAP_SAMPLES
+STITCH_MAX_WORDS = 1
+MAX_LOAD_WORKERS = 8
+# Decoded chunks waiting for inference are capped at this many batches' worth
+LOAD_QUEUE_BATCHES = 2
+LOAD_PUT_TIMEOUT_SEC = 0.1
+# Source rates whose resampling kernels are built when the adapter is created
+COMMON_SOURCE_RATES = (44100, 48000)
+
+SUPPORTED_LANGUAGES: Final[Mapping[str, str]] = MappingProxyType({
+    "English": "eng_Latn",
+    "Filipino/Tagalog": "tgl_Latn",
+    "Spanish": "spa_Latn",
+    "Chinese (Mandarin)": "cmn_Hans",
+    "Japanese": "jpn_Jpan",
+    "Korean": "kor_Hang",
+    "German": "deu_Latn",
+    "French": "fra_Latn",
+    "Italian": "ita_Latn",
+    "Portuguese": "por_Latn",
+    "Russian": "rus_Cyrl",
+    "Arabic": "arb_Arab",
+    "Hindi": "hin_Deva",
+})
+
+MODEL_INFO_STATIC: Final[Mapping[str, str]] = MappingProxyType({
+    "supported_languages": "1600+",
+    "max_audio_length": "40 seconds",
+})
+
+
+def _to_mono(audio: np.ndarray) -> np.ndarray:
+    if audio.ndim > 1:
+        nch = audio.shape[1]
+        audio = np.add.reduce(audio, axis=1, dtype=np.float32)
+        audio *= np.float32(1.0 / nch)
+    return audio
+
+
+def _pad_to_chunk(chunk: np.ndarray) -> np.ndarray:
+    if chunk.shape[0] < CHUNK_SAMPLES:
+        chunk = np.pad(chunk, (0, CHUNK_SAMPLES - chunk.shape[0]))
+    return chunk
+
+
+def _stitch(texts: List[str]) -> str:
+    # Neighbouring chunks share OVERLAP_SAMPLES of audio, which holds about one
+    # word, so that word can end one transcript and start the next. Drop it from
+    # the second text when it repeats; longer matches are real repetitions.
+    words: List[str] = []
+    prev_words: List[str] = []
+    for text in texts:
+        new_words = text.split()
+        overlap = 0
+        # Only the directly preceding chunk shares audio with this one
+        for k in range(min(STITCH_MAX_WORDS, len(prev_words), len(new_words)), 0, -1):
+            if prev_words[-k:] == new_words[:k]:
+                overlap = k
+                break
+        words.extend(new_words[overlap:])
+        prev_words = new_words
+    return " ".join(words)
+
+
+def _configure_allocator() -> None:
+    import torch
+
+    # Chunk and batch lengths vary between calls; expandable segments let the
+    # caching allocator grow blocks in place instead of fragmenting.
+    env_var = "PYTORCH_HIP_ALLOC_CONF" if torch.version.hip else "PYTORCH_CUDA_ALLOC_CONF"
+    current = os.environ.get(env_var, "")
+    if "expandable_segments" in current:
+        return
+    if "cudaMallocAsync" in current:
+        warnings.warn(
+            f"{env_var}={current!r} selects the cudaMallocAsync backend, which does not "
+            "support expandable segments; leaving the allocator unchanged."
+        )
+        return
+    # The allocator reads its configuration once, when CUDA is first initialised
+    if torch.cuda.is_initialized():
+        warnings.warn(
+            "CUDA is already initialised in this process, so expandable_segments cannot "
+            f"be enabled through {env_var}; leaving the allocator unchanged."
+        )
+        return
+    os.environ[env_var] = current + ("," if current else "") + "expandable_segments:True"
+
+
+def _resolve_autocast_dtype(precision: Precision, device: "torch.device") -> Optional["torch.dtype"]:
+    import torch
+
+    if precision not in ("fp32", "bf16", "fp16", "auto"):
+        raise ValueError(f"precision must be one of 'fp32', 'bf16', 'fp16' or 'auto', got {precision!r}")
+    if device.type != "cuda" or precision == "fp32":
+        return None
+    if precision == "bf16":
+        return torch.bfloat16
+    if precision == "fp16":
+        return torch.float16
+    # BF16 is unreliable on consumer ROCm cards such as gfx1030, so prefer FP16 there
+    if torch.version.hip is None and torch.cuda.is_bf16_supported():
+        return torch.bfloat16
+    return torch.float16
+
+
+def _cuda_graphs_supported(device: "torch.device") -> bool:
+    import torch
+
+    # Graph capture of these models needs CUDA 12.3+ in both the toolkit torch was
+    # built with and the installed driver; HIP graphs are not used yet.
+    if device.type != "cuda" or torch.version.hip or not torch.version.cuda:
+        return False
+    if not hasattr(getattr(torch, "compiler", None), "cudagraph_mark_step_begin"):
+        return False
+    get_driver_version = getattr(torch._C, "_cuda_getDriverVersion", None)
+    if get_driver_version is None:
+        return False
+    toolkit = tuple(int(part) for part in torch.version.cuda.split(".")[:2])
+    driver_version = get_driver_version()
+    driver = (driver_version // 1000, driver_version % 1000 // 10)
+    return min(toolkit, driver) >= (12, 3)
+
+
+class _GraphedForward:
+    # Runs the model forward through torch.compile's "reduce-overhead" mode, which
+    # records a CUDA graph on first use and replays it afterwards, but only while
+    # `active` is set. The adapter sets it only for full batches of CHUNK_SAMPLES
+    # windows, so one graph (and memory pool) is kept per batch_size in use;
+    # every other call runs eagerly.
+
+    def __init__(self, forward: Callable[..., Any]):
+        import torch
+
+        self.eager = forward
+        self.compiled = torch.compile(forward, mode="reduce-overhead", dynamic=False)
+        self.active = False
+        self.failed = False
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if not self.active or self.failed:
+            return self.eager(*args, **kwargs)
+
+        import torch
+        from torch._dynamo.exc import TorchDynamoException
+        from torch.utils._pytree import tree_map_only
+
+        try:
+            torch.compiler.cudagraph_mark_step_begin()
+            out = self.compiled(*args, **kwargs)
+        except TorchDynamoException as e:
+            warnings.warn(f"CUDA graph capture failed; running the model eagerly from now on: {e}")
+            self.failed = True
+            return self.eager(*args, **kwargs)
+        # The next replay overwrites the graph's output buffers, so return copies
+        return tree_map_only(torch.Tensor, torch.Tensor.clone, out)
 
 
 class OmniASRAdapter:
     
-    MODEL_CARDS = {
+    MODEL_CARDS: Final[Mapping[str, str]] = MappingProxyType({
         "300M": "omniASR_W2V_300M",
         "1B": "omniASR_W2V_1B",
         "3B": "omniASR_W2V_3B",
         "7B": "omniASR_LLM_7B",
-    }
+    })
     
     def __init__(
         self, 
         model_size: ModelSize = "7B",
         device: Optional[str] = None,
+        tune_allocator: bool = True,
+        precision: Precision = "auto",
+        use_cuda_graphs: bool = False,
     ):
+        import torch
+        from omnilingual_asr.models.inference.pipeline import ASRInferencePipeline
+
+        if tune_allocator:
+            _configure_allocator()
+        
         self.model_size = model_size
         self.model_card = self.MODEL_CARDS[model_size]
         
@@ -34,42 +217,97 @@ class OmniASRAdapter:
             model_card=self.model_card,
             device=device
         )
+        self.device = torch.device(getattr(self.pipeline, "device", "cpu"))
+        self.precision = precision
+        self._autocast_dtype = _resolve_autocast_dtype(precision, self.device)
+        self._resample_kernels: Dict[Tuple[int, int], Tuple["torch.Tensor", int]] = {}
+        for sr in COMMON_SOURCE_RATES:
+            self._get_resample_kernel(sr)
+        
+        # The LLM decoder generates token by token, so only the single-pass CTC
+        # models have a forward with a stable shape worth capturing.
+        model = getattr(self.pipeline, "model", None)
+        self._graphed_forward: Optional[_GraphedForward] = None
+        if (
+            use_cuda_graphs
+            and "LLM" not in self.model_card
+            and isinstance(model, torch.nn.Module)
+            and _cuda_graphs_supported(self.device)
+        ):
+            self._graphed_forward = _GraphedForward(model.forward)
+            model.forward = self._graphed_forward
+        self.use_cuda_graphs = self._graphed_forward is not None
+    
+    def _get_resample_kernel(self, sr: int) -> Tuple["torch.Tensor", int]:
+        import torch
+        from torchaudio.functional.functional import _get_sinc_resample_kernel
+
+        # Same kernel torchaudio's Resample module builds, kept on-device without the module wrapper
+        key = (sr, TARGET_SR)
+        kernel = self._resample_kernels.get(key)
+        if kernel is None:
+            kernel = self._resample_kernels.setdefault(
+                key,
+                _get_sinc_resample_kernel(
+                    sr, TARGET_SR, math.gcd(sr, TARGET_SR), device=self.device, dtype=torch.float32
+                )
+            )
+        return kernel
+    
+    def _resample(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        import torch
+        from torchaudio.functional.functional import _apply_sinc_resample_kernel
+
+        try:
+            audio_tensor = torch.from_numpy(audio).to(self.device)
+            kernel, width = self._get_resample_kernel(sr)
+            audio_resampled = _apply_sinc_resample_kernel(
+                audio_tensor, sr, TARGET_SR, math.gcd(sr, TARGET_SR), kernel, width
+            )
+            return audio_resampled.cpu().numpy()
+        except Exception as e:
+            raise RuntimeError(f"Error resampling audio. Ensure 'libsndfile' is installed. Error: {e}")
     
     def _load_and_chunk_audio(
         self, 
         audio_input: Union[str, Path, np.ndarray], 
         input_sr: Optional[int] = None
-    ) -> List[np.ndarray]:
+    ) -> Iterator[np.ndarray]:
         
         if isinstance(audio_input, (str, Path)):
-            audio, sr = sf.read(audio_input)
+            # Decode one chunk at a time so peak memory does not grow with file length
+            with sf.SoundFile(audio_input) as f:
+                sr = f.samplerate
+                block_frames = CHUNK_DURATION_SEC * sr
+                overlap_frames = int(OVERLAP_DURATION_SEC * sr)
+                needs_resample = sr != TARGET_SR
+                for block in f.blocks(
+                    blocksize=block_frames, overlap=overlap_frames, dtype="float32", always_2d=False
+                ):
+                    chunk = _to_mono(block)
+                    if needs_resample:
+                        chunk = self._resample(chunk, sr)
+                    yield chunk
+            return
         elif isinstance(audio_input, np.ndarray):
             if input_sr is None:
                 raise ValueError("sample_rate is required when audio is a numpy array")
-            audio, sr = audio_input, input_sr
+            # No copy when the caller already passes a contiguous float32 array
+            audio = _to_mono(np.ascontiguousarray(audio_input, dtype=np.float32))
+            sr = input_sr
         
-        if audio.ndim > 1:
-            audio = np.mean(audio, axis=1)
-            
-        audio_resampled = audio
-        if sr != TARGET_SR:
-            try:
-                audio_tensor = torch.from_numpy(audio).float()
-                resampler = T.Resample(orig_freq=sr, new_freq=TARGET_SR)
-                audio_resampled = resampler(audio_tensor).numpy()
-            except Exception as e:
-                raise RuntimeError(f"Error resampling audio. Ensure 'libsndfile' is installed. Error: {e}")
-
+        audio_resampled = audio if sr == TARGET_SR else self._resample(audio, sr)
         duration_samples = audio_resampled.shape[0]
         
         if duration_samples <= CHUNK_SAMPLES:
-            return [audio_resampled]
+            yield audio_resampled
         else:
-            chunks = []
-            for i in range(0, duration_samples, CHUNK_SAMPLES):
-                chunk = audio_resampled[i : i + CHUNK_SAMPLES]
-                chunks.append(chunk)
-            return chunks
+            # Build every full window as one strided view over the signal
+            windows = sliding_window_view(audio_resampled, CHUNK_SAMPLES)[::HOP_SAMPLES]
+            yield from windows
+            tail_start = windows.shape[0] * HOP_SAMPLES
+            if tail_start < duration_samples - OVERLAP_SAMPLES:
+                yield audio_resampled[tail_start:]
 
     def transcribe(
         self,
@@ -78,6 +316,7 @@ class OmniASRAdapter:
         batch_size: int = 2,
         sample_rate: Optional[int] = None
     ) -> Union[str, List[str]]:
+        import torch
         
         is_single: bool
         audio_list: List[Union[str, Path, np.ndarray]]
@@ -97,35 +336,126 @@ class OmniASRAdapter:
         if len(lang_list) != len(audio_list):
             raise ValueError("Number of language codes must match number of audio files")
 
-        all_audio_dicts = []
-        input_to_chunk_map = []
-        processed_lang_list = []
+        chunk_texts: List[List[str]] = [[] for _ in audio_list]
+        # Bounded so loaders can only run a few batches ahead of inference; `stop`
+        # releases them when the caller is done or has failed.
+        loaded: "queue.Queue[Tuple[int, Optional[np.ndarray], Optional[BaseException]]]" = queue.Queue(
+            maxsize=max(1, LOAD_QUEUE_BATCHES * batch_size)
+        )
+        stop = threading.Event()
 
-        for i, aud_input in enumerate(audio_list):
-            audio_chunks_np = self._load_and_chunk_audio(aud_input, sample_rate)
-            
-            for chunk_np in audio_chunks_np:
-                all_audio_dicts.append({
-                    "waveform": chunk_np,
+        def put(item: Tuple[int, Optional[np.ndarray], Optional[BaseException]]) -> bool:
+            while not stop.is_set():
+                try:
+                    loaded.put(item, timeout=LOAD_PUT_TIMEOUT_SEC)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def load(i: int) -> None:
+            if stop.is_set():
+                return
+            chunks = self._load_and_chunk_audio(audio_list[i], sample_rate)
+            try:
+                for chunk in chunks:
+                    if not put((i, chunk, None)):
+                        return
+            except BaseException as e:
+                put((i, None, e))
+            else:
+                put((i, None, None))
+            finally:
+                chunks.close()
+
+        def run_batch(entries: List[_ChunkEntry]) -> None:
+            is_fixed_shape = len(entries) == batch_size and all(
+                waveform.shape[0] == CHUNK_SAMPLES for _, _, waveform, _ in entries
+            )
+            batch = [
+                {
+                    # Overlapping windows are read-only views; give the pipeline its own copy
+                    "waveform": np.require(waveform, dtype=np.float32, requirements=["C", "W"]),
                     "sample_rate": TARGET_SR
-                })
-            
-            input_to_chunk_map.append(len(audio_chunks_np))
-            processed_lang_list.extend([lang_list[i]] * len(audio_chunks_np))
-        
-        all_transcriptions = self.pipeline.transcribe(
-            all_audio_dicts,
-            lang=processed_lang_list,
-            batch_size=batch_size
+                }
+                for _, _, waveform, _ in entries
+            ]
+            # Autotune cuDNN only for the fixed shape, where the tuned kernels are
+            # reused; other lengths would re-run the search every time. Only the
+            # benchmark flag is touched, and it is restored after the call.
+            cudnn = torch.backends.cudnn
+            previous_benchmark = cudnn.benchmark
+            if is_fixed_shape:
+                cudnn.benchmark = True
+            if self._graphed_forward is not None:
+                self._graphed_forward.active = is_fixed_shape
+            try:
+                transcriptions = self.pipeline.transcribe(
+                    batch,
+                    lang=[lang_list[i] for i, _, _, _ in entries],
+                    batch_size=len(batch)
+                )
+            finally:
+                cudnn.benchmark = previous_benchmark
+                if self._graphed_forward is not None:
+                    self._graphed_forward.active = False
+            for (i, k, _, _), text in zip(entries, transcriptions):
+                chunk_texts[i][k] = text
+
+        autocast = (
+            torch.autocast(device_type="cuda", dtype=self._autocast_dtype)
+            if self._autocast_dtype is not None
+            else contextlib.nullcontext()
         )
-        
-        final_results = []
-        current_index = 0
-        for num_chunks in input_to_chunk_map:
-            chunks_for_this_file = all_transcriptions[current_index : current_index + num_chunks]
-            joined_text = " ".join(chunks_for_this_file)
-            final_results.append(joined_text)
-            current_index += num_chunks
+        full_chunks: List[_ChunkEntry] = []
+        short_chunks: List[_ChunkEntry] = []
+
+        # Inputs decode and resample on worker threads (both release the GIL) while
+        # the calling thread runs inference. Full-length chunks all share one shape,
+        # so they are submitted as soon as a batch of them is ready; shorter chunks
+        # wait until everything is loaded and are then batched by length.
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_LOAD_WORKERS, len(audio_list)))) as executor:
+            for i in range(len(audio_list)):
+                executor.submit(load, i)
+            try:
+                with torch.inference_mode(), autocast:
+                    remaining = len(audio_list)
+                    while remaining:
+                        i, chunk, error = loaded.get()
+                        if error is not None:
+                            raise error
+                        if chunk is None:
+                            remaining -= 1
+                            continue
+                        k = len(chunk_texts[i])
+                        chunk_texts[i].append("")
+                        # The pipeline cannot mask padding, so zeros are transcribed like
+                        # audio. Tails are only padded when the fixed-shape graph path
+                        # needs them; otherwise they keep their own length.
+                        valid_length = chunk.shape[0]
+                        waveform = _pad_to_chunk(chunk) if self.use_cuda_graphs and k > 0 else chunk
+                        entry = (i, k, waveform, valid_length)
+                        if waveform.shape[0] == CHUNK_SAMPLES:
+                            full_chunks.append(entry)
+                            if len(full_chunks) == batch_size:
+                                run_batch(full_chunks)
+                                full_chunks = []
+                        else:
+                            short_chunks.append(entry)
+
+                    # Longest first, so each remaining batch pads as little as possible
+                    leftovers = sorted(
+                        full_chunks + short_chunks,
+                        key=lambda entry: (entry[2].shape[0], entry[3]),
+                        reverse=True
+                    )
+                    for start in range(0, len(leftovers), batch_size):
+                        run_batch(leftovers[start : start + batch_size])
+            finally:
+                # Release loaders blocked on a full queue before the executor waits on them
+                stop.set()
+
+        final_results = [_stitch(texts) for texts in chunk_texts]
 
         return final_results[0] if is_single else final_results
     
@@ -144,28 +474,17 @@ class OmniASRAdapter:
     ) -> List[str]:
         return cast(List[str], self.transcribe(audio_files, language=languages, batch_size=batch_size))
     
-    def get_supported_languages(self) -> Dict[str, str]:
+    def get_supported_languages(self) -> Mapping[str, str]:
+        return SUPPORTED_LANGUAGES
+    
+    @classmethod
+    def describe(cls, model_size: str) -> Dict[str, Union[str, int]]:
         return {
-            "English": "eng_Latn",
-            "Filipino/Tagalog": "tgl_Latn",
-            "Spanish": "spa_Latn",
-            "Chinese (Mandarin)": "cmn_Hans",
-            "Japanese": "jpn_Jpan",
-            "Korean": "kor_Hang",
-            "German": "deu_Latn",
-            "French": "fra_Latn",
-            "Italian": "ita_Latn",
-            "Portuguese": "por_Latn",
-            "Russian": "rus_Cyrl",
-            "Arabic": "arb_Arab",
-            "Hindi": "hin_Deva",
+            "model_size": model_size,
+            "model_card": cls.MODEL_CARDS[model_size],
+            **MODEL_INFO_STATIC,
         }
     
     @property
     def model_info(self) -> Dict[str, Union[str, int]]:
-        return {
-            "model_size": self.model_size,
-            "model_card": self.model_card,
-            "supported_languages": "1600+",
-            "max_audio_length": "40 seconds",
-        }
+        return self.describe(self.model_size)
@@ -7,7 +7,7 @@ import sys
 from pathlib import Path
 import json
 
-from omniasr_headless.adapter import OmniASRAdapter
+from omniasr_headless.adapter import SUPPORTED_LANGUAGES, OmniASRAdapter
 
 
 def main():
@@ -95,20 +95,17 @@ Examples:
     
     args = parser.parse_args()
     
-    # Handle info commands
+    # Handle info commands (these only read constants, so no model is loaded)
     if args.list_languages:
-        adapter = OmniASRAdapter(model_size="7B")
-        langs = adapter.get_supported_languages()
         print("\nCommonly Used Language Codes:")
         print("-" * 50)
-        for name, code in langs.items():
+        for name, code in SUPPORTED_LANGUAGES.items():
             print(f"{name:<25} {code}")
         print("\nNote: 1600+ languages supported. See docs for full list.")
         return 0
     
     if args.model_info:
-        adapter = OmniASRAdapter(model_size=args.model)
-        info = adapter.model_info
+        info = OmniASRAdapter.describe(args.model)
         print("\nModel Information:")
         print("-" * 50)
         for key, value in info.items():
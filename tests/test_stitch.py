@@ -0,0 +1,22 @@
+from omniasr_headless.adapter import _stitch
+
+
+def test_single_chunk_is_returned_unchanged():
+    assert _stitch(["hello there my friend"]) == "hello there my friend"
+
+
+def test_word_repeated_across_seam_is_dropped():
+    assert _stitch(["I went home", "home and slept"]) == "I went home and slept"
+
+
+def test_repeat_longer_than_overlap_is_kept():
+    assert _stitch(["see you my friend", "my friend again"]) == "see you my friend my friend again"
+
+
+def test_empty_chunk_does_not_join_chunks_around_it():
+    assert _stitch(["a b", "", "b c"]) == "a b b c"
+
+
+def test_empty_chunks_are_skipped():
+    assert _stitch(["", "a", "", ""]) == "a"
+    assert _stitch([]) == ""